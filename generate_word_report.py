@@ -10,22 +10,124 @@ The caption text defaults to "图{idx} {stem}", where stem is taken from each im
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from importlib import metadata
 import io
+import multiprocessing
+import os
 from pathlib import Path
 import re
+import threading
+import warnings
+import zipfile
 from dataclasses import dataclass
 from typing import Callable, Iterable, List, Optional
+from xml.sax.saxutils import escape
 
 from docx import Document
 from docx.enum.table import WD_TABLE_ALIGNMENT
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml.shape import CT_Inline
+from docx.oxml.table import CT_Tbl
+from docx.parts.image import ImagePart
 from docx.shared import Cm, Pt
+from docx.table import Table, _Cell
+# Pillow-SIMD is a drop-in build with SSE4/AVX2 resize kernels:
+#     pip uninstall pillow && pip install pillow-simd
 from PIL import Image
 
+try:
+    from cykooz_resizer import FilterType, ResizeAlg, ResizeOptions, Resizer
+except ImportError:  # optional SIMD resizer, fall back to Pillow
+    Resizer = None
+
+
+def _has_pillow_simd() -> bool:
+    try:
+        metadata.version("pillow-simd")
+    except metadata.PackageNotFoundError:
+        return False
+    return True
+
+
+_resize_hint_shown = False
+
+
+def _warn_if_slow_resize() -> None:
+    # Called from the parent process only, so spawned workers stay quiet.
+    global _resize_hint_shown
+    if _resize_hint_shown or Resizer is not None or _has_pillow_simd():
+        return
+    _resize_hint_shown = True
+    warnings.warn(
+        "Neither cykooz.resizer nor pillow-simd is installed; "
+        "install one of them for ~2x faster image resizing",
+        stacklevel=3,
+    )
+
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp"}
+_MILEAGE_RE = re.compile(r"[0-9]+(?:\.[0-9]+)?")
+
+RESAMPLE_FILTERS = {"bilinear": Image.BILINEAR, "lanczos": Image.LANCZOS}
+
+if Resizer is not None:
+    _RESIZE_OPTIONS = {
+        Image.BILINEAR: ResizeOptions(resize_alg=ResizeAlg.convolution(FilterType.bilinear)),
+        Image.LANCZOS: ResizeOptions(resize_alg=ResizeAlg.convolution(FilterType.lanczos3)),
+    }
+else:
+    _RESIZE_OPTIONS = {}
+
+_QN_P = qn("w:p")
+_QN_TCMAR = qn("w:tcMar")
+_QN_TYPE = qn("w:type")
+_QN_W = qn("w:w")
+_QN_TBLBORDERS = qn("w:tblBorders")
+_TCMAR_EDGES = tuple((edge, qn(f"w:{edge}")) for edge in ("top", "start", "bottom", "end"))
+
+_ZERO_TCMAR_XML = (
+    f"<w:tcMar {nsdecls('w')}>"
+    '<w:top w:type="dxa" w:w="0"/>'
+    '<w:start w:type="dxa" w:w="0"/>'
+    '<w:bottom w:type="dxa" w:w="0"/>'
+    '<w:end w:type="dxa" w:w="0"/>'
+    "</w:tcMar>"
+)
+_TBL_BORDERS_XML = (
+    f"<w:tblBorders {nsdecls('w')}>"
+    '<w:top w:val="nil"/>'
+    '<w:left w:val="nil"/>'
+    '<w:bottom w:val="nil"/>'
+    '<w:right w:val="nil"/>'
+    '<w:insideH w:val="nil"/>'
+    '<w:insideV w:val="nil"/>'
+    "</w:tblBorders>"
+)
+_CAPTION_XML_TEMPLATE = (
+    f"<w:p {nsdecls('w')}>"
+    '<w:pPr><w:spacing w:before="0" w:after="0"/><w:jc w:val="center"/></w:pPr>'
+    "<w:r><w:rPr>"
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:eastAsia="宋体"/>'
+    '<w:sz w:val="21"/>'
+    '</w:rPr><w:t xml:space="preserve">{label}</w:t></w:r>'
+    "</w:p>"
+)
+
+# Per-process cache of encoded images, bounded by total size so a long-lived
+# GUI session does not keep every report's images alive.
+_IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_image_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_image_cache_bytes = 0
+_image_cache_lock = threading.Lock()
+
+# Resizer keeps internal scratch buffers, so each worker thread gets its own.
+_resizer_local = threading.local()
 
 
 @dataclass
@@ -37,20 +139,22 @@ class ImageItem:
 
 
 def parse_mileage(text: str) -> float:
-    digits = re.findall(r"[0-9]+(?:\.[0-9]+)?", text)
-    if not digits:
-        return float("inf")
-    try:
-        return float(digits[0])
-    except ValueError:
-        return float("inf")
+    match = _MILEAGE_RE.search(text)
+    return float(match.group()) if match else float("inf")
 
 
 def find_images(folder: Path) -> List[ImageItem]:
-    items: List[ImageItem] = []
-    for path in folder.iterdir():
-        if path.is_file() and path.suffix.lower() in IMAGE_EXTS:
-            stem = path.stem
+    # Collect columns first and sort indices, so the key avoids attribute lookups.
+    paths: List[Path] = []
+    mileage_texts: List[str] = []
+    mileage_values: List[float] = []
+    y_values: List[int] = []
+    # DirEntry caches the file type from the directory read, saving a stat per file.
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            stem, _, ext = entry.name.rpartition(".")
+            if not stem or f".{ext.lower()}" not in IMAGE_EXTS or not entry.is_file():
+                continue
             if "-" in stem:
                 parts = stem.split("-", 1)
                 mileage_text = parts[0].strip()
@@ -61,16 +165,24 @@ def find_images(folder: Path) -> List[ImageItem]:
             else:
                 mileage_text = stem.strip()
                 y_value = 0
-            items.append(
-                ImageItem(
-                    path=path,
-                    mileage_text=mileage_text,
-                    mileage_value=parse_mileage(mileage_text),
-                    y_value=y_value,
-                )
-            )
-    items.sort(key=lambda item: (item.mileage_value, item.y_value, item.mileage_text))
-    return items
+            paths.append(Path(entry.path))
+            mileage_texts.append(mileage_text)
+            mileage_values.append(parse_mileage(mileage_text))
+            y_values.append(y_value)
+
+    order = sorted(
+        range(len(paths)),
+        key=lambda i: (mileage_values[i], y_values[i], mileage_texts[i]),
+    )
+    return [
+        ImageItem(
+            path=paths[i],
+            mileage_text=mileage_texts[i],
+            mileage_value=mileage_values[i],
+            y_value=y_values[i],
+        )
+        for i in order
+    ]
 
 
 def chunked(items: Iterable[ImageItem], size: int) -> Iterable[List[ImageItem]]:
@@ -84,15 +196,10 @@ def chunked(items: Iterable[ImageItem], size: int) -> Iterable[List[ImageItem]]:
         yield row
 
 
-def add_caption_run(run, label: str) -> None:
-    run.text = label
-    font = run.font
-    font.size = Pt(10.5)
-    font.name = "Times New Roman"
-    r_fonts = run._element.rPr.rFonts
-    r_fonts.set(qn("w:ascii"), "Times New Roman")
-    r_fonts.set(qn("w:hAnsi"), "Times New Roman")
-    r_fonts.set(qn("w:eastAsia"), "宋体")
+def add_caption_block(cell, label: str) -> None:
+    tc = cell._tc
+    tc.remove(tc.find(_QN_P))
+    tc.append(parse_xml(_CAPTION_XML_TEMPLATE.format(label=escape(label))))
 
 
 def _cm_to_twips(value: float) -> int:
@@ -102,52 +209,139 @@ def _cm_to_twips(value: float) -> int:
 def set_cell_margins(cell, *, top=0.0, start=0.0, bottom=0.0, end=0.0):
     tc = cell._tc
     tcPr = tc.get_or_add_tcPr()
-    tcMar = tcPr.find(qn("w:tcMar"))
+    tcMar = tcPr.find(_QN_TCMAR)
     if tcMar is None:
+        if top == start == bottom == end == 0:
+            # build_document only ever asks for zero margins on fresh cells.
+            tcPr.append(parse_xml(_ZERO_TCMAR_XML))
+            return
         tcMar = OxmlElement("w:tcMar")
         tcPr.append(tcMar)
 
-    for attr, value in {"top": top, "start": start, "bottom": bottom, "end": end}.items():
-        element = tcMar.find(qn(f"w:{attr}"))
+    for (attr, attr_qn), value in zip(_TCMAR_EDGES, (top, start, bottom, end)):
+        element = tcMar.find(attr_qn)
         if element is None:
             element = OxmlElement(f"w:{attr}")
             tcMar.append(element)
-        element.set(qn("w:type"), "dxa")
-        element.set(qn("w:w"), str(_cm_to_twips(value)))
+        element.set(_QN_TYPE, "dxa")
+        element.set(_QN_W, str(_cm_to_twips(value)))
 
 
-def prepare_image_stream(image_path: Path, width_cm: float, height_cm: float) -> io.BytesIO:
+def _table_row_xml(column_widths: List[float]) -> str:
+    cells = "".join(
+        f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{Cm(width).twips}"/></w:tcPr><w:p/></w:tc>'
+        for width in column_widths
+    )
+    return f"<w:tr {nsdecls('w')}>{cells}</w:tr>"
+
+
+def _get_resizer():
+    if Resizer is None:
+        return None
+    resizer = getattr(_resizer_local, "resizer", None)
+    if resizer is None:
+        resizer = _resizer_local.resizer = Resizer()
+    return resizer
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        # Flatten transparent areas onto white instead of whatever RGB they hide.
+        with img.convert("RGBA") as rgba, Image.new("RGBA", img.size, "white") as background:
+            background.alpha_composite(rgba)
+            return background.convert("RGB")
+    return img.convert("RGB")
+
+
+def prepare_image_stream(
+    image_path: Path, width_cm: float, height_cm: float, resample: int = Image.BILINEAR
+) -> bytes:
+    # mtime/size are part of the key so an edited file is re-encoded; callers
+    # must wrap the bytes in a fresh BytesIO.
+    stat = image_path.stat()
+    key = (image_path, stat.st_mtime_ns, stat.st_size, width_cm, height_cm, resample)
+    with _image_cache_lock:
+        blob = _image_cache.get(key)
+        if blob is not None:
+            _image_cache.move_to_end(key)
+            return blob
+
+    blob = _prepare_image_bytes(image_path, width_cm, height_cm, resample)
+    _cache_image(key, blob)
+    return blob
+
+
+def _cache_image(key: tuple, blob: bytes) -> None:
+    global _image_cache_bytes
+    with _image_cache_lock:
+        if key in _image_cache:
+            return
+        _image_cache[key] = blob
+        _image_cache_bytes += len(blob)
+        while _image_cache_bytes > _IMAGE_CACHE_MAX_BYTES:
+            _, evicted = _image_cache.popitem(last=False)
+            _image_cache_bytes -= len(evicted)
+
+
+def _prepare_image_bytes(
+    image_path: Path, width_cm: float, height_cm: float, resample: int
+) -> bytes:
     dpi = 220
     target_w = int(round(width_cm / 2.54 * dpi))
     target_h = int(round(height_cm / 2.54 * dpi))
 
     with Image.open(image_path) as img:
-        img = img.convert("RGB")
-        scale = min(target_w / img.width, target_h / img.height, 1.0)
-        new_size = (
-            max(1, int(round(img.width * scale))),
-            max(1, int(round(img.height * scale))),
-        )
-        resized = img.resize(new_size, Image.LANCZOS)
+        if img.format == "JPEG" and img.mode == "RGB" and img.size == (target_w, target_h):
+            # Already exactly the target box: hand the original JPEG to Word.
+            return image_path.read_bytes()
+
+        # Let the JPEG decoder do a cheap DCT downscale first (no-op otherwise).
+        img.draft("RGB", (target_w * 2, target_h * 2))
+        img = _to_rgb(img)
+        # Intermediate frames are closed as soon as the JPEG is encoded.
+        frames = [img]
+        try:
+            scale = min(target_w / img.width, target_h / img.height, 1.0)
+            new_size = (
+                max(1, int(round(img.width * scale))),
+                max(1, int(round(img.height * scale))),
+            )
+            resizer = _get_resizer()
+            resize_options = _RESIZE_OPTIONS.get(resample)
+            if scale == 1.0:
+                resized = img
+            elif resizer is not None and resize_options is not None:
+                resized = Image.new("RGB", new_size)
+                frames.append(resized)
+                resizer.resize_pil(img, resized, resize_options)
+            else:
+                resized = img.resize(new_size, resample, reducing_gap=3.0)
+                frames.append(resized)
 
-        canvas = Image.new("RGB", (target_w, target_h), color="white")
-        offset = ((target_w - new_size[0]) // 2, (target_h - new_size[1]) // 2)
-        canvas.paste(resized, offset)
+            if new_size == (target_w, target_h):
+                canvas = resized
+            else:
+                canvas = Image.new("RGB", (target_w, target_h), color="white")
+                frames.append(canvas)
+                offset = ((target_w - new_size[0]) // 2, (target_h - new_size[1]) // 2)
+                canvas.paste(resized, offset)
 
-        stream = io.BytesIO()
-        canvas.save(stream, format="PNG", dpi=(dpi, dpi))
-        stream.seek(0)
-        return stream
+            with io.BytesIO() as stream:
+                canvas.save(stream, format="JPEG", quality=85, optimize=True, dpi=(dpi, dpi))
+                return stream.getvalue()
+        finally:
+            for frame in frames:
+                frame.close()
 
 
-def add_image_block(cell, image_stream: io.BytesIO, width_cm: float, height_cm: float) -> None:
-    cell.text = ""
+def add_image_block(cell, inline: CT_Inline) -> None:
     pic_para = cell.paragraphs[0]
     pic_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
     pic_para.paragraph_format.space_before = Pt(0)
     pic_para.paragraph_format.space_after = Pt(2)
-    run = pic_para.add_run()
-    run.add_picture(image_stream, width=Cm(width_cm), height=Cm(height_cm))
+    pic_para.add_run()._r.add_drawing(inline)
 
 
 def build_document(
@@ -156,80 +350,124 @@ def build_document(
     width_cm: float,
     height_cm: float,
     progress_callback: Optional[Callable[[int, int], None]] = None,
+    resample: int = Image.BILINEAR,
+    workers: int = 1,
 ) -> Document:
     document = Document()
     section = document.sections[0]
     section.left_margin = Cm(2.76)
     section.right_margin = Cm(2.76)
 
-    table = document.add_table(rows=0, cols=3)
+    # Rows are appended as raw <w:tr> elements and wrapped in _Cell directly;
+    # Row.cells re-walks the whole table, which made add_row() quadratic.
+    tbl = CT_Tbl.new_tbl(0, 3, document._block_width)
+    document.element.body._insert_tbl(tbl)
+    table = Table(tbl, document._body)
     table.autofit = False
     table.alignment = WD_TABLE_ALIGNMENT.LEFT
 
     gap_width = max(0.1, 11.70 - 2.76 - width_cm)
     column_widths = [width_cm, gap_width, width_cm]
+    row_xml = _table_row_xml(column_widths)
 
-    def add_row():
-        row = table.add_row()
-        for idx, width in enumerate(column_widths):
-            cell = row.cells[idx]
-            cell.width = Cm(width)
+    def add_row() -> List[_Cell]:
+        tr = parse_xml(row_xml)
+        tbl.append(tr)
+        cells = [_Cell(tc, table) for tc in tr.tc_lst]
+        for cell in cells:
             set_cell_margins(cell, top=0, start=0, bottom=0, end=0)
-        return row
+        return cells
+
+    # Only the first two images of a chunk get a cell (columns 0 and 2).
+    placed = [item for row_images in chunked(images, per_row) for item in row_images[:2]]
+    labels = [
+        f"图5.6-{idx} {item.mileage_text}S{(idx - 1) % 3 + 1}沉降曲线"
+        for idx, item in enumerate(placed, start=1)
+    ]
 
     image_index = 1
     processed = 0
     total = len(images)
-    image_streams: List[io.BytesIO] = []
-    for row_images in chunked(images, per_row):
-        img_row = add_row()
-        cap_row = add_row()
-
-        for col_idx, cell_idx in enumerate((0, 2)):
-            if col_idx < len(row_images):
-                image_item = row_images[col_idx]
-                s_cycle = (image_index - 1) % 3 + 1
-                label = (
-                    f"图5.6-{image_index} {image_item.mileage_text}S{s_cycle}沉降曲线"
-                )
-                stream = prepare_image_stream(image_item.path, width_cm, height_cm)
-                image_streams.append(stream)
-                add_image_block(img_row.cells[cell_idx], stream, width_cm, height_cm)
-                processed += 1
-                if progress_callback:
-                    progress_callback(processed, total)
-
-                caption_cell = cap_row.cells[cell_idx]
-                caption_cell.text = ""
-                caption_para = caption_cell.paragraphs[0]
-                caption_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                caption_para.paragraph_format.space_before = Pt(0)
-                caption_para.paragraph_format.space_after = Pt(0)
-                add_caption_run(caption_para.add_run(), label)
-                image_index += 1
-            else:
-                img_row.cells[cell_idx].text = ""
-                cap_row.cells[cell_idx].text = ""
-
-        img_row.cells[1].text = ""
-        cap_row.cells[1].text = ""
+    # Drawing ids are assigned here because StoryPart.next_id, used by
+    # run.add_picture, rescans the whole document on every call.
+    shape_id = document.part.next_id
+    width, height = Cm(width_cm), Cm(height_cm)
+
+    # Preprocess every placed image up front and only consume the results in
+    # document order below. Decode/resize/encode mostly release the GIL, so
+    # threads are the default; workers > 1 moves the work to processes instead.
+    executor: Executor
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    with executor:
+        futures = [
+            executor.submit(prepare_image_stream, item.path, width_cm, height_cm, resample)
+            for item in placed
+        ]
+        try:
+            for row_images in chunked(images, per_row):
+                img_cells = add_row()
+                cap_cells = add_row()
+
+                for col_idx, cell_idx in enumerate((0, 2)):
+                    if col_idx < len(row_images):
+                        # Drop the future once consumed. With workers > 1 this frees
+                        # the bytes; with threads the bounded image cache may keep them.
+                        blob = futures[image_index - 1].result()
+                        futures[image_index - 1] = None
+                        # Reuses the existing part and rId for duplicate images.
+                        with io.BytesIO(blob) as stream:
+                            rId, image = document.part.get_or_add_image(stream)
+                        inline = CT_Inline.new_pic_inline(
+                            shape_id, rId, image.filename, width, height
+                        )
+                        shape_id += 1
+                        add_image_block(img_cells[cell_idx], inline)
+                        processed += 1
+                        if progress_callback:
+                            progress_callback(processed, total)
+
+                        add_caption_block(cap_cells[cell_idx], labels[image_index - 1])
+                        image_index += 1
+        except BaseException:
+            # Surface the first failure now instead of after the queued images.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
 
     # Remove table borders
-    tbl_pr = table._tbl.tblPr
-    tbl_borders = tbl_pr.find(qn("w:tblBorders"))
-    if tbl_borders is None:
-        tbl_borders = OxmlElement("w:tblBorders")
-        tbl_pr.append(tbl_borders)
-    for edge in ("top", "left", "bottom", "right", "insideH", "insideV"):
-        element = tbl_borders.find(qn(f"w:{edge}"))
-        if element is None:
-            element = OxmlElement(f"w:{edge}")
-            tbl_borders.append(element)
-        element.set(qn("w:val"), "nil")
+    tbl_pr = tbl.tblPr
+    tbl_borders = tbl_pr.find(_QN_TBLBORDERS)
+    if tbl_borders is not None:
+        tbl_pr.remove(tbl_borders)
+    tbl_pr.append(parse_xml(_TBL_BORDERS_XML))
 
     return document
 
 
+# Same package layout as Document.save(), but XML parts use the fastest deflate
+# level and already-compressed image parts are stored as-is.
+def save_document(document: Document, output_path: Path) -> None:
+    package = document.part.package
+    parts = package.parts
+    for part in parts:
+        part.before_marshal()
+
+    with zipfile.ZipFile(
+        output_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1
+    ) as zipf:
+        zipf.writestr(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob)
+        zipf.writestr(PACKAGE_URI.rels_uri.membername, package.rels.xml)
+        for part in parts:
+            compress_type = (
+                zipfile.ZIP_STORED if isinstance(part, ImagePart) else zipfile.ZIP_DEFLATED
+            )
+            zipf.writestr(part.partname.membername, part.blob, compress_type=compress_type)
+            if len(part.rels):
+                zipf.writestr(part.partname.rels_uri.membername, part.rels.xml)
+
+
 def generate_word_report(
     image_dir: Path,
     output_path: Path,
@@ -237,6 +475,8 @@ def generate_word_report(
     width_cm: float = 7.6,
     height_cm: float = 4.7,
     progress_callback: Optional[Callable[[int, int], None]] = None,
+    resample: int = Image.BILINEAR,
+    workers: int = 1,
 ) -> None:
     if not image_dir.is_dir():
         raise FileNotFoundError(f"Image directory not found: {image_dir}")
@@ -245,10 +485,18 @@ def generate_word_report(
     if not images:
         raise ValueError("No supported image files were found in the folder.")
 
+    _warn_if_slow_resize()
+
     document = build_document(
-        images, per_row, width_cm, height_cm, progress_callback=progress_callback
+        images,
+        per_row,
+        width_cm,
+        height_cm,
+        progress_callback=progress_callback,
+        resample=resample,
+        workers=workers,
     )
-    document.save(str(output_path))
+    save_document(document, output_path)
 
 
 def parse_args() -> argparse.Namespace:
@@ -268,6 +516,18 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--width-cm", type=float, default=7.6, help="Image width in cm")
     parser.add_argument("--height-cm", type=float, default=4.7, help="Image height in cm")
+    parser.add_argument(
+        "--resample",
+        choices=sorted(RESAMPLE_FILTERS),
+        default="bilinear",
+        help="Resampling filter used when shrinking images",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes for image preprocessing (1 uses threads)",
+    )
     return parser.parse_args()
 
 
@@ -295,6 +555,8 @@ def main() -> None:
             args.width_cm,
             args.height_cm,
             progress_callback=progress_cb,
+            resample=RESAMPLE_FILTERS[args.resample],
+            workers=args.workers,
         )
     except Exception as exc:
         raise SystemExit(str(exc))
@@ -305,5 +567,6 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
 